@@ -1,65 +1,70 @@
-import random
+import logging
+import secrets
+from typing import Optional
+
 import aiohttp
 from .config import settings
 
+logger = logging.getLogger(__name__)
+
 
 def generate_otp() -> str:
-    """Generate a 6-digit OTP code."""
-    return str(random.randint(100000, 999999))
-
-
-async def send_otp_email(to_email: str, otp_code: str):
-    """Send OTP code via Brevo API."""
-    if not settings.BREVO_API_KEY:
-        print(f"[DEV MODE] OTP for {to_email}: {otp_code}")
-        return
-
-    html_body = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-            .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-            .otp-box {{ background: white; border: 2px dashed #667eea; padding: 20px; text-align: center; margin: 20px 0; border-radius: 8px; }}
-            .otp-code {{ font-size: 32px; font-weight: bold; color: #667eea; letter-spacing: 5px; font-family: 'Courier New', monospace; }}
-            .warning {{ color: #e74c3c; font-size: 14px; margin-top: 20px; }}
-            .footer {{ text-align: center; color: #888; font-size: 12px; margin-top: 20px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🔐 Password Reset Request</h1>
+    """Generate a 6-digit OTP code from a cryptographically secure source."""
+    return f"{secrets.randbelow(900000) + 100000:06d}"
+
+
+# Only the OTP code varies between sends: everything around it (including the
+# constant expiry and sender name) is built once at import time.
+_HTML_PREFIX = """
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }
+        .content { background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }
+        .otp-box { background: white; border: 2px dashed #667eea; padding: 20px; text-align: center; margin: 20px 0; border-radius: 8px; }
+        .otp-code { font-size: 32px; font-weight: bold; color: #667eea; letter-spacing: 5px; font-family: 'Courier New', monospace; }
+        .warning { color: #e74c3c; font-size: 14px; margin-top: 20px; }
+        .footer { text-align: center; color: #888; font-size: 12px; margin-top: 20px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🔐 Password Reset Request</h1>
+        </div>
+        <div class="content">
+            <p>Hello,</p>
+            <p>You have requested to reset your password. Please use the following One-Time Password (OTP) to complete the process:</p>
+            
+            <div class="otp-box">
+                <div class="otp-code">"""
+
+_HTML_SUFFIX = f"""</div>
             </div>
-            <div class="content">
-                <p>Hello,</p>
-                <p>You have requested to reset your password. Please use the following One-Time Password (OTP) to complete the process:</p>
-                
-                <div class="otp-box">
-                    <div class="otp-code">{otp_code}</div>
-                </div>
-                
-                <p><strong>This code will expire in {settings.OTP_EXPIRE_MINUTES} minutes.</strong></p>
-                
-                <p class="warning">⚠️ If you did not request this password reset, please ignore this email and your password will remain unchanged.</p>
-                
-                <div class="footer">
-                    <p>---</p>
-                    <p>{settings.EMAIL_FROM_NAME}</p>
-                </div>
+            
+            <p><strong>This code will expire in {settings.OTP_EXPIRE_MINUTES} minutes.</strong></p>
+            
+            <p class="warning">⚠️ If you did not request this password reset, please ignore this email and your password will remain unchanged.</p>
+            
+            <div class="footer">
+                <p>---</p>
+                <p>{settings.EMAIL_FROM_NAME}</p>
             </div>
         </div>
-    </body>
-    </html>
-    """
+    </div>
+</body>
+</html>
+"""
 
-    text_body = f"""
+_TEXT_PREFIX = """
 Password Reset Request
 
-Your OTP code is: {otp_code}
+Your OTP code is: """
+
+_TEXT_SUFFIX = f"""
 
 This code will expire in {settings.OTP_EXPIRE_MINUTES} minutes.
 
@@ -69,43 +74,76 @@ If you did not request this, please ignore this email.
 {settings.EMAIL_FROM_NAME}
     """
 
-    try:
-        # Prepare Brevo API request
-        headers = {
-            "api-key": settings.BREVO_API_KEY,
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "sender": {
-                "name": settings.EMAIL_FROM_NAME,
-                "email": settings.EMAIL_FROM_ADDRESS
-            },
-            "to": [{"email": to_email}],
-            "subject": "🔐 Password Reset OTP Code",
-            "htmlContent": html_body,
-            "textContent": text_body
-        }
-        
-        # Send email via Brevo API using HTTP
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.brevo.com/v3/smtp/email",
+
+BREVO_SEND_URL = "https://api.brevo.com/v3/smtp/email"
+BREVO_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=5)
+
+# Shared HTTP session so the TLS connection to Brevo stays alive between sends
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared Brevo HTTP session, creating it on first use."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+            timeout=BREVO_TIMEOUT,
+        )
+    return _http_session
+
+
+async def close_http_session():
+    """Close the shared HTTP session (called on application shutdown)."""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+if settings.BREVO_API_KEY:
+    # Request headers and sender are constant for the process lifetime
+    _BREVO_HEADERS = {
+        "api-key": settings.BREVO_API_KEY,
+        "Content-Type": "application/json"
+    }
+    _BREVO_SENDER = {
+        "name": settings.EMAIL_FROM_NAME,
+        "email": settings.EMAIL_FROM_ADDRESS
+    }
+
+    async def send_otp_email(to_email: str, otp_code: str):
+        """Send OTP code via Brevo API; failures are logged, not raised (runs as a background task)."""
+        html_body = _HTML_PREFIX + otp_code + _HTML_SUFFIX
+        text_body = _TEXT_PREFIX + otp_code + _TEXT_SUFFIX
+
+        try:
+            payload = {
+                "sender": _BREVO_SENDER,
+                "to": [{"email": to_email}],
+                "subject": "🔐 Password Reset OTP Code",
+                "htmlContent": html_body,
+                "textContent": text_body
+            }
+            
+            # Send email via Brevo API using the shared keep-alive session
+            async with get_http_session().post(
+                BREVO_SEND_URL,
                 json=payload,
-                headers=headers
+                headers=_BREVO_HEADERS
             ) as response:
-                result = await response.json()
+                result = await response.json(content_type=None)
                 
                 if response.status == 201:
                     message_id = result.get('messageId', 'unknown')
-                    print(f"[EMAIL SENT] OTP sent to {to_email}, message_id={message_id}")
+                    logger.info("[EMAIL SENT] OTP sent to %s, message_id=%s", to_email, message_id)
                 else:
-                    print(f"[EMAIL ERROR] Failed to send to {to_email}: {result}")
-                    print(f"[DEV MODE FALLBACK] OTP for {to_email}: {otp_code}")
                     raise Exception(f"Brevo API error: {result}")
-                    
-    except Exception as e:
-        print(f"[EMAIL ERROR] Failed to send to {to_email}: {str(e)}")
-        print(f"[DEV MODE FALLBACK] OTP for {to_email}: {otp_code}")
-        raise
-
+                        
+        except Exception as e:
+            logger.error("[EMAIL ERROR] Failed to send to %s: %s", to_email, e)
+            logger.warning("[DEV MODE FALLBACK] OTP for %s: %s", to_email, otp_code)
+else:
+    async def send_otp_email(to_email: str, otp_code: str):
+        """Dev mode (no BREVO_API_KEY): log the OTP instead of sending it."""
+        logger.warning("[DEV MODE] OTP for %s: %s", to_email, otp_code)
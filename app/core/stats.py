@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from contextlib import suppress
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert
+
+from .database import SessionLocal
+from ..models.update_version import UpdateStatistic
+
+logger = logging.getLogger(__name__)
+
+# Rows are flushed when a batch is full or this many seconds after its first row
+STAT_BATCH_SIZE = 100
+STAT_FLUSH_INTERVAL = 1.0
+STAT_QUEUE_SIZE = 10000
+
+_stat_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+
+
+def encode_machine_hash(value: str) -> bytes:
+    """Decode a hex machine hash to raw bytes; non-hex values (e.g. "browser_download") are stored as UTF-8."""
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        return value.encode()
+
+
+def stat_row(
+    machine_hash: str | bytes,
+    action: str,
+    status: Optional[str] = None,
+    current_version: Optional[str] = None,
+    target_version: Optional[str] = None,
+    revit_version: Optional[str] = None,
+    os_version: Optional[str] = None,
+    error_message: Optional[str] = None,
+) -> dict:
+    """Build one UpdateStatistic row; every row has the same keys so batches insert together."""
+    return {
+        "machine_hash": machine_hash if isinstance(machine_hash, bytes) else encode_machine_hash(machine_hash),
+        "current_version": current_version,
+        "target_version": target_version,
+        "revit_version": revit_version,
+        "os_version": os_version,
+        "action": action,
+        "status": status,
+        "error_message": error_message,
+        "timestamp": datetime.utcnow(),
+    }
+
+
+def write_statistics(rows: list[dict]):
+    """Insert a batch of statistic rows in one statement and one commit."""
+    try:
+        with SessionLocal() as db:
+            db.execute(insert(UpdateStatistic), rows)
+            db.commit()
+    except Exception as e:
+        logger.error("[STATS ERROR] Dropped %d statistic rows: %s", len(rows), e)
+
+
+async def log_statistic(**fields):
+    """Queue một dòng UpdateStatistic, được ghi theo batch bởi background writer"""
+    row = stat_row(**fields)
+    if _stat_queue is None:
+        # Writer not running (e.g. app started without lifespan) - write directly
+        await asyncio.to_thread(write_statistics, [row])
+        return
+    await _stat_queue.put(row)
+
+
+async def _run_stat_writer(queue: asyncio.Queue):
+    loop = asyncio.get_running_loop()
+    batch: list[dict] = []
+    try:
+        while True:
+            batch.append(await queue.get())
+            deadline = loop.time() + STAT_FLUSH_INTERVAL
+            while len(batch) < STAT_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            pending, batch = batch, []
+            await asyncio.to_thread(write_statistics, pending)
+    finally:
+        # Shutdown: flush whatever is still queued
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch:
+            write_statistics(batch)
+
+
+def start_stat_writer():
+    """Start the background statistics writer (called on application startup)."""
+    global _stat_queue, _writer_task
+    _stat_queue = asyncio.Queue(maxsize=STAT_QUEUE_SIZE)
+    _writer_task = asyncio.create_task(_run_stat_writer(_stat_queue))
+
+
+async def stop_stat_writer():
+    """Stop the writer and flush pending rows (called on application shutdown)."""
+    global _stat_queue, _writer_task
+    task = _writer_task
+    _stat_queue = None
+    _writer_task = None
+    if task is not None:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
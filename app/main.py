@@ -1,19 +1,50 @@
+import atexit
+import logging
+import queue
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import LargeBinary, inspect, text
 from sqlalchemy.orm import Session
 from .core.database import engine, Base, SessionLocal
 from .core.config import settings
 from .core.security import get_password_hash
+from .core.email import close_http_session
+from .core.stats import start_stat_writer, stop_stat_writer
 from .models.user import User
 from .models.otp import OTPRecord
 from .models.update_version import UpdateVersion, UpdateStatistic
 from .models.chat import ChatSession, ChatMessage, CachedQuery  # NEW: Chat models
 from .routers.auth import router as auth_router
 from .routers.keys import router as keys_router
-from .routers.updates import router as updates_router
+from .routers.updates import router as updates_router, parse_version
 from .routers.chat import router as chat_router  # NEW: Chat router
 
-app = FastAPI(title=settings.APP_NAME)
+# App loggers only enqueue records; a listener thread writes them to stderr
+log_queue = queue.SimpleQueue()
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+log_listener = QueueListener(log_queue, log_stream_handler)
+app_logger = logging.getLogger("app")
+app_logger.setLevel(logging.INFO)
+app_logger.addHandler(QueueHandler(log_queue))
+app_logger.propagate = False
+# Start with the handler (not in lifespan) so records are written even without lifespan
+log_listener.start()
+atexit.register(log_listener.stop)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_stat_writer()
+    yield
+    # Flush queued update statistics and release the pooled Brevo connection
+    await stop_stat_writer()
+    await close_http_session()
+
+
+app = FastAPI(title=settings.APP_NAME, lifespan=lifespan)
 
 # Configure CORS
 raw_origins = settings.CORS_ORIGINS or "*"
@@ -30,6 +61,37 @@ app.add_middleware(
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+# create_all does not alter existing tables: add columns introduced later
+with engine.begin() as conn:
+    existing_columns = {c["name"] for c in inspect(conn).get_columns("update_versions")}
+    for column in ("version_major", "version_minor", "version_build", "version_revision"):
+        if column not in existing_columns:
+            conn.execute(text(f"ALTER TABLE update_versions ADD COLUMN {column} INTEGER"))
+
+    # machine_hash chuyển từ chuỗi hex sang binary (SQLite không cần đổi kiểu cột)
+    if conn.dialect.name == "postgresql":
+        stat_columns = {c["name"]: c["type"] for c in inspect(conn).get_columns("update_statistics")}
+        if not isinstance(stat_columns["machine_hash"], LargeBinary):
+            conn.execute(text(
+                "ALTER TABLE update_statistics ALTER COLUMN machine_hash TYPE BYTEA USING "
+                "CASE WHEN machine_hash ~ '^([0-9a-fA-F]{2})+$' THEN decode(machine_hash, 'hex') "
+                "ELSE convert_to(machine_hash, 'UTF8') END"
+            ))
+
+# Create indexes added after the tables already existed
+for index in UpdateVersion.__table__.indexes | UpdateStatistic.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+
+# Backfill parsed version parts for versions created before they were stored
+with SessionLocal() as db:
+    for version in db.query(UpdateVersion).filter(UpdateVersion.version_major.is_(None)):
+        try:
+            parts = parse_version(version.version)
+        except ValueError:
+            continue
+        version.version_major, version.version_minor, version.version_build, version.version_revision = parts
+    db.commit()
+
 # Seed default admin user if not exists
 with SessionLocal() as db:
     if not db.query(User).filter(User.username == "admin").first():
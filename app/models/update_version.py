@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, DateTime, Boolean, BigInteger, Text
+from sqlalchemy import Integer, String, DateTime, Boolean, BigInteger, Text, Index, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column
 from datetime import datetime
 from ..core.database import Base
@@ -9,6 +9,11 @@ class UpdateVersion(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     version: Mapped[str] = mapped_column(String(20), unique=True, nullable=False)
+    # Phần số của version (major.minor.build.revision), tính sẵn từ `version` khi tạo
+    version_major: Mapped[int] = mapped_column(Integer, nullable=True)
+    version_minor: Mapped[int] = mapped_column(Integer, nullable=True)
+    version_build: Mapped[int] = mapped_column(Integer, nullable=True)
+    version_revision: Mapped[int] = mapped_column(Integer, nullable=True)
     release_date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     release_notes: Mapped[str] = mapped_column(Text, nullable=True)
     download_url: Mapped[str] = mapped_column(String(500), nullable=False)
@@ -27,7 +32,8 @@ class UpdateStatistic(Base):
     __tablename__ = "update_statistics"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    machine_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Hash máy dạng bytes (hex đã decode, 32 bytes cho SHA-256) thay vì chuỗi hex
+    machine_hash: Mapped[bytes] = mapped_column(LargeBinary(32), nullable=False)
     current_version: Mapped[str] = mapped_column(String(20), nullable=True)
     target_version: Mapped[str] = mapped_column(String(20), nullable=True)
     revit_version: Mapped[str] = mapped_column(String(10), nullable=True)
@@ -36,3 +42,17 @@ class UpdateStatistic(Base):
     status: Mapped[str] = mapped_column(String(20), nullable=True)  # success, failed, cancelled
     error_message: Mapped[str] = mapped_column(Text, nullable=True)
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+# Index cho truy vấn "version active mới nhất" (/check, /health, /latest).
+# Partial index trên Postgres/SQLite vì truy vấn luôn lọc is_active = true.
+Index(
+    "ix_uv_active_date",
+    UpdateVersion.is_active,
+    UpdateVersion.release_date.desc(),
+    postgresql_where=UpdateVersion.is_active == True,
+    sqlite_where=UpdateVersion.is_active == True,
+)
+
+# Index cho các truy vấn thống kê lọc/group theo action và status
+Index("ix_us_action_status", UpdateStatistic.action, UpdateStatistic.status)
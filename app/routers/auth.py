@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
 from ..core.database import get_db
 from ..core.security import verify_password, create_access_token, get_password_hash
@@ -21,7 +21,11 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/request-reset")
-async def request_reset(payload: RequestResetRequest, db: Session = Depends(get_db)):
+async def request_reset(
+    payload: RequestResetRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
     """Request password reset: validate passwords, send OTP to email."""
     if payload.new_password != payload.confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
@@ -50,8 +54,8 @@ async def request_reset(payload: RequestResetRequest, db: Session = Depends(get_
     db.add(otp_record)
     db.commit()
     
-    # Send OTP email
-    await send_otp_email(payload.email, otp_code)
+    # Send OTP email after the response is returned so the caller doesn't wait on Brevo
+    background_tasks.add_task(send_otp_email, payload.email, otp_code)
     
     return {"message": "OTP sent to email", "expires_in_minutes": settings.OTP_EXPIRE_MINUTES}
 
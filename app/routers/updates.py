@@ -1,29 +1,41 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Body
+from fastapi.responses import FileResponse, ORJSONResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, BeforeValidator, Field, WithJsonSchema
+from collections import defaultdict
 from datetime import datetime
-from typing import Optional, List
+from functools import lru_cache
+from typing import Annotated, Optional, List
 from ..core.database import get_db
 from ..core.security import get_current_user
+from ..core.stats import log_statistic, encode_machine_hash, stat_row, write_statistics
 from ..models.update_version import UpdateVersion, UpdateStatistic
 from ..models.user import User
+import asyncio
 import hashlib
 import os
+import time
 import zipfile
 import tempfile
 from pathlib import Path
 
-router = APIRouter(prefix="/updates", tags=["updates"])
+router = APIRouter(prefix="/updates", tags=["updates"], default_response_class=ORJSONResponse)
 
 # ==================== Pydantic Models ====================
 
+# Hash máy gửi lên dạng hex, lưu dạng bytes
+MachineHash = Annotated[
+    bytes,
+    BeforeValidator(lambda v: encode_machine_hash(v) if isinstance(v, str) else v),
+    WithJsonSchema({"type": "string", "description": "Hex machine hash"}),
+]
+
 class UpdateCheckRequest(BaseModel):
     product: str = Field(..., validation_alias="Product", description="Tên sản phẩm: SimpleBIM")
     currentVersion: str = Field(..., validation_alias="CurrentVersion", description="Version hiện tại của add-in")
     revitVersion: str = Field(..., validation_alias="RevitVersion", description="Phiên bản Revit đang chạy")
-    machineHash: str = Field(..., validation_alias="MachineHash", description="Hash máy để logging")
+    machineHash: MachineHash = Field(..., validation_alias="MachineHash", description="Hash máy (hex) để logging")
     os: str = Field(..., validation_alias="OS", description="Chuỗi OS")
     
     class Config:
@@ -45,6 +57,14 @@ class UpdateCheckResponse(BaseModel):
     class Config:
         populate_by_name = True
 
+class DownloadStatIn(BaseModel):
+    version: str
+    machine_hash: MachineHash
+
+class InstallStatIn(DownloadStatIn):
+    success: bool
+    error_message: Optional[str] = None
+
 class VersionCreate(BaseModel):
     version: str
     release_notes: str
@@ -70,7 +90,7 @@ class VersionUpdate(BaseModel):
 class VersionResponse(BaseModel):
     id: int
     version: str
-    release_date: str
+    release_date: datetime
     release_notes: Optional[str]
     download_url: str
     file_size: int
@@ -79,19 +99,82 @@ class VersionResponse(BaseModel):
     force_update: bool
     min_required_version: str
     is_active: bool
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
 
 # ==================== Helper Functions ====================
 
-def parse_version(version_str: str) -> tuple:
-    """Parse semantic version string to tuple for comparison"""
-    parts = version_str.strip().lstrip('vV').split('.')
-    while len(parts) < 4:
-        parts.append('0')
-    return tuple(int(p) for p in parts[:4])
+@lru_cache(maxsize=1024)
+def parse_version(version_str: str) -> tuple[int, int, int, int]:
+    """Parse semantic version string to tuple for comparison (cached per distinct string)"""
+    s = version_str.strip()
+    if s[:1] in "vV":
+        s = s[1:]
+    a, b, c, d, *_ = (*s.split("."), "0", "0", "0", "0")
+    return (int(a), int(b), int(c), int(d))
+
+# In-process cache of the latest active version for /check and /health.
+# Holds (cached_at, snapshot) where snapshot is a plain dict, not an ORM instance.
+_CACHE_TTL = 30  # seconds
+_latest_cache: tuple[float, Optional[dict]] = (0.0, None)
+
+
+def _get_latest_version(db: Session) -> Optional[dict]:
+    """Lấy version active mới nhất, cache trong _CACHE_TTL giây"""
+    global _latest_cache
+    cached_at, snapshot = _latest_cache
+    if cached_at and time.monotonic() - cached_at < _CACHE_TTL:
+        return snapshot
+    
+    latest = db.query(UpdateVersion).filter(
+        UpdateVersion.is_active == True
+    ).order_by(desc(UpdateVersion.release_date)).first()
+    
+    snapshot = None
+    if latest:
+        snapshot = {
+            "id": latest.id,
+            "version": latest.version,
+            "version_tuple": (
+                latest.version_major, latest.version_minor,
+                latest.version_build, latest.version_revision,
+            ) if latest.version_major is not None else None,
+            "release_date": latest.release_date,
+            "release_notes": latest.release_notes,
+            "download_url": latest.download_url,
+            "file_size": latest.file_size,
+            "checksum_sha256": latest.checksum_sha256,
+            "update_type": latest.update_type,
+            "min_required_version": latest.min_required_version,
+            "updated_at": latest.updated_at,
+            # Phần cố định của response /check, tính sẵn một lần
+            "check_response": {
+                "LatestVersion": latest.version,
+                "MinimumRequiredVersion": latest.min_required_version,
+                "ReleaseDate": latest.release_date,
+                "ReleaseNotes": latest.release_notes or "",
+                "DownloadUrl": latest.download_url,
+                "FileSize": latest.file_size,
+                "ChecksumSHA256": latest.checksum_sha256,
+            },
+        }
+    _latest_cache = (time.monotonic(), snapshot)
+    return snapshot
+
+
+def _invalidate_latest_cache():
+    """Reset cache sau khi admin thay đổi versions"""
+    global _latest_cache
+    _latest_cache = (0.0, None)
+
+def compute_file_checksum(file_path: str) -> tuple[str, int]:
+    """Return (sha256 hex digest, size in bytes) of a file - blocking, run via asyncio.to_thread"""
+    # file_digest reads and hashes in C (OpenSSL), no per-chunk Python loop
+    with open(file_path, "rb") as f:
+        sha256_hash = hashlib.file_digest(f, "sha256")
+    return sha256_hash.hexdigest(), os.path.getsize(file_path)
 
 def create_release_zip(version: UpdateVersion, repo_path: str) -> str:
     """
@@ -130,14 +213,16 @@ def create_release_zip(version: UpdateVersion, repo_path: str) -> str:
 # ==================== Public Endpoints (No Auth) ====================
 
 @router.post("/check", response_model=UpdateCheckResponse)
-async def check_for_updates(request: UpdateCheckRequest, db: Session = Depends(get_db)):
+async def check_for_updates(
+    request: UpdateCheckRequest,
+    http_request: Request,
+    db: Session = Depends(get_db)
+):
     """Kiểm tra xem có update mới không - endpoint public cho SimpleBIM client"""
     
     try:
-        # Get latest active version
-        latest = db.query(UpdateVersion).filter(
-            UpdateVersion.is_active == True
-        ).order_by(desc(UpdateVersion.release_date)).first()
+        # Get latest active version (cached)
+        latest = _get_latest_version(db)
         
         if not latest:
             return UpdateCheckResponse(
@@ -156,15 +241,15 @@ async def check_for_updates(request: UpdateCheckRequest, db: Session = Depends(g
         
         # Compare versions
         current_version = parse_version(request.currentVersion)
-        latest_version = parse_version(latest.version)
+        latest_version = latest["version_tuple"] or parse_version(latest["version"])
         update_available = latest_version > current_version
         
         # Check minimum required version
-        min_required = parse_version(latest.min_required_version)
+        min_required = parse_version(latest["min_required_version"])
         force_update = current_version < min_required
         
         # Determine update type
-        update_type = latest.update_type
+        update_type = latest["update_type"]
         if force_update:
             update_type = "mandatory"
         
@@ -176,31 +261,36 @@ async def check_for_updates(request: UpdateCheckRequest, db: Session = Depends(g
         else:
             notification_msg = "✅ Bạn đang sử dụng phiên bản mới nhất"
         
-        # Log activity
-        stat = UpdateStatistic(
+        # Log activity (batched by the background stats writer)
+        await log_statistic(
             machine_hash=request.machineHash,
             current_version=request.currentVersion,
-            target_version=latest.version if update_available else None,
+            target_version=latest["version"] if update_available else None,
             revit_version=request.revitVersion,
             os_version=request.os,
             action="check",
             status="success"
         )
-        db.add(stat)
-        db.commit()
         
-        return UpdateCheckResponse(
-            updateAvailable=update_available,
-            latestVersion=latest.version,
-            minimumRequiredVersion=latest.min_required_version,
-            releaseDate=latest.release_date.isoformat(),
-            releaseNotes=latest.release_notes or "",
-            downloadUrl=latest.download_url,
-            fileSize=latest.file_size,
-            checksumSHA256=latest.checksum_sha256,
-            updateType=update_type,
-            forceUpdate=force_update,
-            notificationMessage=notification_msg
+        # Response chỉ phụ thuộc vào version mới nhất và version của client,
+        # client gửi lại ETag qua If-None-Match sẽ nhận 304 không có body
+        etag = '"%s"' % hashlib.blake2s(
+            f"{latest['id']}:{latest['release_date']}:{latest['updated_at']}:{request.currentVersion}".encode(),
+            digest_size=16
+        ).hexdigest()
+        if http_request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        # Ghép phần cố định đã cache với các field theo client, bỏ qua Pydantic serialization
+        return ORJSONResponse(
+            content={
+                "UpdateAvailable": update_available,
+                **latest["check_response"],
+                "UpdateType": update_type,
+                "ForceUpdate": force_update,
+                "NotificationMessage": notification_msg,
+            },
+            headers={"ETag": etag}
         )
         
     except Exception as e:
@@ -208,56 +298,59 @@ async def check_for_updates(request: UpdateCheckRequest, db: Session = Depends(g
 
 
 @router.post("/download-stats")
-async def log_download_started(
-    version: str,
-    machine_hash: str,
-    db: Session = Depends(get_db)
-):
+async def log_download_started(payload: DownloadStatIn):
     """Log khi user bắt đầu download update"""
-    stat = UpdateStatistic(
-        machine_hash=machine_hash,
-        target_version=version,
+    await log_statistic(
+        machine_hash=payload.machine_hash,
+        target_version=payload.version,
         action="download",
         status="started"
     )
-    db.add(stat)
-    db.commit()
     return {"status": "logged"}
 
 
 @router.post("/install-stats")
-async def log_install_result(
-    version: str,
-    machine_hash: str,
-    success: bool,
-    error_message: Optional[str] = None,
-    db: Session = Depends(get_db)
-):
+async def log_install_result(payload: InstallStatIn):
     """Log kết quả install update"""
-    stat = UpdateStatistic(
-        machine_hash=machine_hash,
-        target_version=version,
+    await log_statistic(
+        machine_hash=payload.machine_hash,
+        target_version=payload.version,
         action="install",
-        status="success" if success else "failed",
-        error_message=error_message
+        status="success" if payload.success else "failed",
+        error_message=payload.error_message
     )
-    db.add(stat)
-    db.commit()
     return {"status": "logged"}
 
 
+@router.post("/stats/batch")
+async def log_download_batch(
+    payload: Annotated[List[DownloadStatIn], Body(max_length=100)]
+):
+    """Log nhiều lượt download (tối đa 100) trong một request, ghi bằng một câu INSERT"""
+    if payload:
+        rows = [
+            stat_row(
+                machine_hash=item.machine_hash,
+                target_version=item.version,
+                action="download",
+                status="started"
+            )
+            for item in payload
+        ]
+        await asyncio.to_thread(write_statistics, rows)
+    return {"status": "logged", "count": len(payload)}
+
+
 @router.get("/health")
 async def health_check(db: Session = Depends(get_db)):
     """Health check endpoint"""
-    latest = db.query(UpdateVersion).filter(
-        UpdateVersion.is_active == True
-    ).order_by(desc(UpdateVersion.release_date)).first()
+    latest = _get_latest_version(db)
     
     return {
         "status": "healthy",
         "service": "SimpleBIM Update Service",
         "version": "1.0.0",
-        "latest_version_known": latest.version if latest else None
+        "latest_version_known": latest["version"] if latest else None
     }
 
 
@@ -286,7 +379,7 @@ async def get_public_active_versions(db: Session = Depends(get_db)):
         result.append({
             "id": v.id,
             "version": v.version,
-            "release_date": v.release_date.isoformat(),
+            "release_date": v.release_date,
             "release_notes": v.release_notes,
             "download_url": v.download_url,
             "file_size": v.file_size,
@@ -295,7 +388,7 @@ async def get_public_active_versions(db: Session = Depends(get_db)):
             "force_update": v.force_update,
             "min_required_version": v.min_required_version,
             "is_active": v.is_active,
-            "created_at": v.created_at.isoformat(),
+            "created_at": v.created_at,
             "download_count": download_count,
             "install_count": install_count
         })
@@ -329,7 +422,7 @@ async def get_latest_version(db: Session = Depends(get_db)):
     return {
         "id": latest.id,
         "version": latest.version,
-        "release_date": latest.release_date.isoformat(),
+        "release_date": latest.release_date,
         "release_notes": latest.release_notes,
         "download_url": latest.download_url,
         "file_size": latest.file_size,
@@ -338,7 +431,7 @@ async def get_latest_version(db: Session = Depends(get_db)):
         "force_update": latest.force_update,
         "min_required_version": latest.min_required_version,
         "is_active": latest.is_active,
-        "created_at": latest.created_at.isoformat(),
+        "created_at": latest.created_at,
         "download_count": download_count,
         "install_count": install_count
     }
@@ -352,24 +445,9 @@ async def get_all_versions(
     db: Session = Depends(get_db)
 ):
     """Lấy danh sách tất cả versions - Admin only"""
-    versions = db.query(UpdateVersion).order_by(desc(UpdateVersion.release_date)).all()
-    return [
-        VersionResponse(
-            id=v.id,
-            version=v.version,
-            release_date=v.release_date.isoformat(),
-            release_notes=v.release_notes,
-            download_url=v.download_url,
-            file_size=v.file_size,
-            checksum_sha256=v.checksum_sha256,
-            update_type=v.update_type,
-            force_update=v.force_update,
-            min_required_version=v.min_required_version,
-            is_active=v.is_active,
-            created_at=v.created_at.isoformat()
-        )
-        for v in versions
-    ]
+    # Stream rows in chunks instead of loading the whole history up front
+    versions = db.query(UpdateVersion).order_by(desc(UpdateVersion.release_date)).yield_per(100)
+    return [VersionResponse.model_validate(v) for v in versions]
 
 
 @router.post("/versions", response_model=VersionResponse)
@@ -394,6 +472,11 @@ async def create_version(
     if existing:
         raise HTTPException(status_code=400, detail=f"Version {data.version} already exists")
     
+    try:
+        major, minor, build, revision = parse_version(data.version)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid version format: {data.version}")
+    
     # Calculate file_size from file if not provided or is 0
     file_size = data.file_size or 0
     if file_size <= 0 and data.download_url:
@@ -407,6 +490,10 @@ async def create_version(
     
     new_version = UpdateVersion(
         version=data.version,
+        version_major=major,
+        version_minor=minor,
+        version_build=build,
+        version_revision=revision,
         release_date=datetime.utcnow(),
         release_notes=data.release_notes,
         download_url=data.download_url,
@@ -421,21 +508,9 @@ async def create_version(
     db.add(new_version)
     db.commit()
     db.refresh(new_version)
+    _invalidate_latest_cache()
     
-    return VersionResponse(
-        id=new_version.id,
-        version=new_version.version,
-        release_date=new_version.release_date.isoformat(),
-        release_notes=new_version.release_notes,
-        download_url=new_version.download_url,
-        file_size=new_version.file_size,
-        checksum_sha256=new_version.checksum_sha256,
-        update_type=new_version.update_type,
-        force_update=new_version.force_update,
-        min_required_version=new_version.min_required_version,
-        is_active=new_version.is_active,
-        created_at=new_version.created_at.isoformat()
-    )
+    return VersionResponse.model_validate(new_version)
 
 
 @router.put("/versions/{version_id}")
@@ -467,6 +542,7 @@ async def update_version(
     try:
         db.commit()
         db.refresh(version)
+        _invalidate_latest_cache()
         print(f"Update successful for version {version_id}")
         
         # Calculate download_count and install_count from statistics table
@@ -484,7 +560,7 @@ async def update_version(
         return {
             "id": version.id,
             "version": version.version,
-            "release_date": version.release_date.isoformat(),
+            "release_date": version.release_date,
             "release_notes": version.release_notes,
             "download_url": version.download_url,
             "file_size": version.file_size,
@@ -493,7 +569,7 @@ async def update_version(
             "force_update": version.force_update,
             "min_required_version": version.min_required_version,
             "is_active": version.is_active,
-            "created_at": version.created_at.isoformat(),
+            "created_at": version.created_at,
             "download_count": download_count,
             "install_count": install_count
         }
@@ -515,6 +591,7 @@ async def deactivate_version(
     
     version.is_active = False
     db.commit()
+    _invalidate_latest_cache()
     
     return {"status": "deactivated", "version": version.version}
 
@@ -532,6 +609,7 @@ async def delete_version(
     
     db.delete(version)
     db.commit()
+    _invalidate_latest_cache()
     
     return {"status": "deleted", "version": version.version}
 
@@ -543,13 +621,23 @@ async def get_update_statistics(
 ):
     """Get analytics về updates - Admin only"""
     
-    total_checks = db.query(UpdateStatistic).filter(UpdateStatistic.action == "check").count()
-    total_downloads = db.query(UpdateStatistic).filter(UpdateStatistic.action == "download").count()
-    total_installs = db.query(UpdateStatistic).filter(UpdateStatistic.action == "install").count()
-    success_installs = db.query(UpdateStatistic).filter(
-        UpdateStatistic.action == "install",
-        UpdateStatistic.status == "success"
-    ).count()
+    # One GROUP BY query instead of a COUNT per metric
+    counts = db.query(
+        UpdateStatistic.action,
+        UpdateStatistic.status,
+        func.count(UpdateStatistic.id)
+    ).group_by(UpdateStatistic.action, UpdateStatistic.status).all()
+    
+    action_totals = defaultdict(int)
+    success_installs = 0
+    for action, status, count in counts:
+        action_totals[action] += count
+        if action == "install" and status == "success":
+            success_installs += count
+    
+    total_checks = action_totals["check"]
+    total_downloads = action_totals["download"]
+    total_installs = action_totals["install"]
     
     success_rate = round(100 * success_installs / total_installs, 2) if total_installs > 0 else 0
     
@@ -584,14 +672,8 @@ async def calculate_file_checksum(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
             
-        sha256_hash = hashlib.sha256()
-        
-        with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        
-        checksum = sha256_hash.hexdigest()
-        file_size = os.path.getsize(file_path)
+        # Hash in a worker thread so large files don't block the event loop
+        checksum, file_size = await asyncio.to_thread(compute_file_checksum, file_path)
         
         return {
             "file_path": file_path,
@@ -630,14 +712,12 @@ async def download_version(
         zip_path = create_release_zip(version, repo_root)
         
         # Log download statistic
-        stat = UpdateStatistic(
+        await log_statistic(
             machine_hash="browser_download",
             target_version=version.version,
             action="download",
             status="web_started"
         )
-        db.add(stat)
-        db.commit()
         
         # Trả về file để download
         return FileResponse(
@@ -663,14 +743,12 @@ async def track_download(
         if not version:
             raise HTTPException(status_code=404, detail="Version not found")
         
-        stat = UpdateStatistic(
+        await log_statistic(
             machine_hash=machine_hash or "unknown",
             target_version=version.version,
             action="download",
             status="web_tracked"
         )
-        db.add(stat)
-        db.commit()
         
         return {
             "status": "success",